@@ -1,20 +1,82 @@
+import functools
+import os
 import os.path as osp
 import zipfile as z
 from collections import OrderedDict
 
+import h5py
 import mne
 import numpy as np
+from joblib import Parallel, delayed
 from mne import create_info
 from mne.io import RawArray
+from numpy.lib.stride_tricks import sliding_window_view
 
 from moabb.datasets import download as dl
 from moabb.datasets.base import BaseDataset
 
 
+try:
+    import numcodecs
+    import zarr
+
+    _zarr_available = True
+except ImportError:
+    _zarr_available = False
+
+try:
+    import numba
+
+    _numba_available = True
+except ImportError:
+    _numba_available = False
+
 Castillos2023_URL = "https://zenodo.org/records/8255618"
 
 TRIAL_PRESENTATION_TIME = 2.2
 
+# Characters stripped from the code part of the annotation descriptions, applied
+# with a single str.translate instead of chained str.replace calls
+ANNOTATION_CLEANUP = str.maketrans("", "", "\n[] ")
+
+
+if _numba_available:
+
+    @numba.njit(parallel=True, cache=True)
+    def _copy_windows_numba(data, length, n_samples_windows):
+        """Materialize the frame windows in float32, parallelized over trials."""
+        n_trials, n_channels, _ = data.shape
+        X = np.empty((n_trials * length, n_channels, n_samples_windows), dtype=np.float32)
+        for t in numba.prange(n_trials):
+            for i in range(length):
+                for c in range(n_channels):
+                    for s in range(n_samples_windows):
+                        X[t * length + i, c, s] = np.float32(data[t, c, i + s])
+        return X
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_root(url, path=None, force_update=False, verbose=None):
+    """Download and extract the dataset archive once per process.
+
+    Every subject and paradigm shares the same archive, so the download check
+    and unzip only need to run on the first data_path call.
+    """
+    path_zip = dl.data_dl(url, "4Class-VEP", path, force_update, verbose)
+    path_folder = osp.dirname(path_zip) + osp.sep
+
+    # Extract only the members that are missing or incomplete, so a partially
+    # extracted archive resumes instead of rewriting every file
+    with z.ZipFile(path_zip, "r") as zip_ref:
+        for member in zip_ref.infolist():
+            dst = osp.join(path_folder, member.filename)
+            if member.is_dir():
+                os.makedirs(dst, exist_ok=True)
+            elif not osp.exists(dst) or osp.getsize(dst) != member.file_size:
+                zip_ref.extract(member, path_folder)
+
+    return path_folder
+
 
 class BaseCastillos2023(BaseDataset):
     def __init__(
@@ -25,6 +87,8 @@ class BaseCastillos2023(BaseDataset):
         paradigm,
         paradigm_type,
         window_size=0.25,
+        target_sfreq=None,
+        cache_windows=False,
     ):
         super().__init__(
             subjects=list(range(1, 12 + 1)),
@@ -40,87 +104,62 @@ class BaseCastillos2023(BaseDataset):
         self.fps = 60
         self.n_channels = 32
         self.window_size = window_size
+        self.target_sfreq = target_sfreq
+        self.cache_windows = cache_windows
 
-    def _add_stim_channel_trial(
-        self, raw, onsets, labels, offset=200, ch_name="stim_trial"
-    ):
-        """
-        Add a stimulus channel with trial onsets and their labels.
-
-        Parameters
-        ----------
-        raw: mne.Raw
-            The raw object to add the stimulus channel to.
-        onsets: List | np.ndarray
-            The onsets of the trials in sample numbers.
-        labels: List | np.ndarray
-            The labels of the trials.
-        offset: int (default: 200)
-            The integer value to start markers with. For instance, if 200, then label 0 will be marker 200, label 1
-            will be be marker 201, etc.
-        ch_name: str (default: "stim_trial")
-            The name of the added stimulus channel.
-
-        Returns
-        -------
-        mne.Raw
-            The raw object with the added stimulus channel.
-        """
-        stim_chan = np.zeros((1, len(raw)))
-        for onset, label in zip(onsets, labels):
-            stim_chan[0, onset] = offset + label
-        info = create_info(
-            ch_names=[ch_name],
-            ch_types=["stim"],
-            sfreq=raw.info["sfreq"],
-            verbose=False,
-        )
-        raw = raw.add_channels([RawArray(data=stim_chan, info=info, verbose=False)])
-        return raw
-
-    def _add_stim_channel_epoch(
+    def _add_stim_channels(
         self,
         raw,
-        onsets,
-        labels,
-        offset=100,
-        ch_name="stim_epoch",
+        trial_onsets,
+        trial_labels,
+        epoch_onsets,
+        epoch_labels,
+        trial_offset=200,
+        epoch_offset=100,
     ):
         """
-        Add a stimulus channel with epoch onsets and their labels, which are the values of the presented code for each
-        of the trials.
+        Add the trial and the epoch stimulus channels in a single add_channels call.
+
+        The trial channel marks the onset of each trial with its label, the epoch channel marks the onset of each
+        epoch (ie. frame) with the value of the presented code. Both channels are filled in one (2, n_samples) array
+        so add_channels copies the raw buffer only once instead of once per channel.
 
         Parameters
         ----------
         raw: mne.Raw
-            The raw object to add the stimulus channel to.
-        onsets: List | np.ndarray
+            The raw object to add the stimulus channels to.
+        trial_onsets: List | np.ndarray
             The onsets of the trials in sample numbers.
-        labels: List | np.ndarray
+        trial_labels: List | np.ndarray
             The labels of the trials.
-        codes: np.ndarray
-            The codebook containing each presented code of shape (nb_bits, nb_codes), sampled at the presentation rate.
-        offset: int (default: 100)
-            The integer value to start markers with. For instance, if 100, then label 0 will be marker 100, label 1
-            will be be marker 101, etc.
-        ch_name: str (default: "stim_epoch")
-            The name of the added stimulus channel.
+        epoch_onsets: List | np.ndarray
+            The onsets of the epochs in seconds.
+        epoch_labels: List | np.ndarray
+            The labels of the epochs.
+        trial_offset: int (default: 200)
+            The integer value to start the trial markers with. For instance, if 200, then label 0 will be marker 200,
+            label 1 will be be marker 201, etc.
+        epoch_offset: int (default: 100)
+            The integer value to start the epoch markers with.
 
         Returns
         -------
         mne.Raw
-            The raw object with the added stimulus channel.
+            The raw object with the added stimulus channels.
         """
-        stim_chan = np.zeros((1, len(raw)))
-        for onset, label in zip(onsets, labels):
-            stim_chan[0, int(onset * self.sfreq)] = offset + label
+        stim_chans = np.zeros((2, len(raw)))
+        trial_onsets = np.asarray(trial_onsets, dtype=np.int64)
+        trial_labels = np.asarray(trial_labels, dtype=np.int64)
+        stim_chans[0, trial_onsets] = trial_offset + trial_labels
+        epoch_idx = (np.asarray(epoch_onsets) * self.sfreq).astype(np.int64)
+        stim_chans[1, epoch_idx] = epoch_offset + np.asarray(epoch_labels)
         info = create_info(
-            ch_names=[ch_name],
-            ch_types=["stim"],
+            ch_names=["stim_trial", "stim_epoch"],
+            ch_types=["stim", "stim"],
             sfreq=raw.info["sfreq"],
             verbose=False,
         )
-        raw = raw.add_channels([RawArray(data=stim_chan, info=info, verbose=False)])
+        raw = raw.add_channels([RawArray(data=stim_chans, info=info, verbose=False)])
         return raw
 
     def _get_single_subject_data(self, subject):
@@ -128,29 +167,34 @@ class BaseCastillos2023(BaseDataset):
         file_path_list = self.data_path(subject, self.paradigm_type)
         raw = mne.io.read_raw_eeglab(file_path_list[0], preload=True, verbose=False)
 
+        # Optionally downsample before epoching: every downstream buffer
+        # (epochs, windows, cache) scales linearly with the sampling rate.
+        # Compare against the rate of the freshly read raw, not self.sfreq,
+        # so the guard stays correct for every subject loaded on this instance
+        if self.target_sfreq is not None:
+            if raw.info["sfreq"] != self.target_sfreq:
+                raw.resample(self.target_sfreq, npad="auto", verbose=False)
+            self.sfreq = self.target_sfreq
+
         # Strip the annotations that were script to make them easier to process
-        events, event_id = mne.events_from_annotations(
-            raw, event_id="auto", verbose=False
+        desc = raw.annotations.description
+        to_remove = np.array(
+            [("collects" in d) or ("iti" in d) or (d == "[]") for d in desc]
         )
-        to_remove = []
-        for idx in range(len(raw.annotations.description)):
-            if (
-                ("collects" in raw.annotations.description[idx])
-                or ("iti" in raw.annotations.description[idx])
-                or (raw.annotations.description[idx] == "[]")
-            ):
-                to_remove.append(idx)
-            else:
-                code = raw.annotations.description[idx].split("_")[0]
-                lab = raw.annotations.description[idx].split("_")[1]
-                code = code.replace("\n", "")
-                code = code.replace("[", "")
-                code = code.replace("]", "")
-                code = code.replace(" ", "")
-                raw.annotations.description[idx] = code + "_" + lab
-        to_remove = np.array(to_remove)
-        if len(to_remove) > 0:
-            raw.annotations.delete(to_remove)
+        raw.annotations.description = np.array(
+            [
+                (
+                    d
+                    if rm
+                    else d.split("_")[0].translate(ANNOTATION_CLEANUP)
+                    + "_"
+                    + d.split("_")[1]
+                )
+                for d, rm in zip(desc, to_remove)
+            ]
+        )
+        if to_remove.any():
+            raw.annotations.delete(np.flatnonzero(to_remove))
 
         # Get the labels and data
         events, event_id = mne.events_from_annotations(
@@ -164,33 +208,54 @@ class BaseCastillos2023(BaseDataset):
             tmin=shift,
             tmax=2.2 + shift,
             baseline=(None, None),
-            preload=False,
+            preload=True,
             verbose=False,
         )
         labels = epochs.events[..., -1]
         onset_code = epochs.events[..., 0]
         labels -= np.min(labels)
-        data = epochs.get_data()
+        # Preloading gives one contiguous read of the raw instead of one lazy
+        # read per epoch; keep the data single precision for the window builder
+        # and drop the Epochs object before the windows allocate
+        try:
+            data = epochs.get_data(copy=False)
+        except TypeError:  # the copy argument only exists from mne 1.6 on
+            data = epochs.get_data()
+        data = data.astype(np.float32, copy=False)
+        del epochs
         self.codes = self._code2array(event_id)
 
         n_samples_windows = int(self.window_size * self.sfreq)
 
-        # Get the windows epoch of each frame, the label of each frame and the onset for each frame in sample time
-        raw_window, y_window, frame_taken = self._to_window_by_frame(
-            data, labels, n_samples_windows, self.codes
-        )
+        # Get the label of each frame and the onset for each frame in sample time.
+        # Only the labels feed the stim channels below, so the cache (opt-in via
+        # cache_windows) stores the labels alone and a hit skips the window
+        # building entirely.
+        y_window = None
+        if self.cache_windows:
+            cache_fname = self._window_cache_fname(subject)
+            source_mtime = osp.getmtime(file_path_list[0])
+            y_window = self._load_window_cache(cache_fname, source_mtime)
+        if y_window is None:
+            _, y_window, frame_taken = self._to_window_by_frame(
+                data, labels, n_samples_windows, self.codes
+            )
+            if self.cache_windows:
+                self._save_window_cache(cache_fname, y_window, source_mtime)
+        else:
+            frame_taken = np.arange(y_window.shape[0], dtype=np.int64)
         onset, onset_0 = self._onset_annotations(frame_taken, y_window, onset_code, 1, 60)
 
-        # Create stim channel with trial information (i.e., symbols)
-        # Specifically: 200 = symbol-0, 201 = symbol-1, 202 = symbol-2, etc.
-        raw = self._add_stim_channel_trial(raw, onset_code, labels, offset=200)
-        # Create stim channel with epoch information (i.e., 1 / 0, or on / off)
-        # Specifically: 100 = "0", 101 = "1"
-        raw = self._add_stim_channel_epoch(
+        # Create one stim channel with trial information (i.e., symbols)
+        # (specifically: 200 = symbol-0, 201 = symbol-1, 202 = symbol-2, etc.)
+        # and one with epoch information (i.e., 1 / 0, or on / off; specifically:
+        # 100 = "0", 101 = "1"), appended in a single add_channels call
+        raw = self._add_stim_channels(
             raw,
+            onset_code,
+            labels,
             np.concatenate([onset, onset_0]),
             np.concatenate([np.ones(onset.shape), np.zeros(onset_0.shape)]),
-            offset=100,
         )
 
         # There is only one session, one trial of 60 subtrials
@@ -199,14 +264,141 @@ class BaseCastillos2023(BaseDataset):
 
         return sessions
 
+    def load_all(self, n_jobs=-1):
+        """
+        Load the data of every subject, dispatching subjects over a process pool.
+
+        The subjects are entirely independent, so the EEGLAB read and the window building parallelize with
+        near-linear scaling. Combine with the zarr cache backend (MOABB_CACHE_BACKEND=zarr) so the workers do not
+        contend on h5py's GIL-holding read path.
+
+        Parameters
+        ----------
+        n_jobs: int (default: -1)
+            The number of joblib workers; -1 uses all the cores.
+
+        Returns
+        -------
+        dict
+            A dict mapping each subject to its sessions, as returned by _get_single_subject_data.
+        """
+        # Download and extract the archive once in the parent: _resolve_root's
+        # lru_cache is per-process, so the workers would otherwise all extract
+        # the same archive concurrently and could read half-written .set files
+        self.data_path(self.subject_list[0], self.paradigm_type)
+        data = Parallel(n_jobs=n_jobs)(
+            delayed(self._get_single_subject_data)(subject)
+            for subject in self.subject_list
+        )
+        return dict(zip(self.subject_list, data))
+
+    # Parsed codebooks shared by all instances: the code strings of a paradigm
+    # are identical across subjects, so each codebook is parsed only once
+    _codes_cache = {}
+
     def _code2array(self, event_id):
         """Return the code of the event ID in a good format"""
-        codes = OrderedDict()
-        for k, v in event_id.items():
-            code = k.split("_")[0]
-            code = code.replace(".", "").replace("2", "")
-            codes[v - 1] = np.array(list(map(int, code)))
-        return codes
+        key = tuple(sorted(event_id.items()))
+        codes = self._codes_cache.get(key)
+        if codes is None:
+            codes = OrderedDict()
+            for k, v in event_id.items():
+                code = k.split("_")[0]
+                code = code.replace(".", "").replace("2", "")
+                # Each character is '0' or '1', so the digits can be read in a
+                # single C-level pass instead of boxing every int
+                codes[v - 1] = np.frombuffer(
+                    code.encode("ascii"), dtype=np.uint8
+                ) - np.uint8(48)
+            self._codes_cache[key] = codes
+        # Shallow copy so a caller mutating dataset.codes cannot corrupt the
+        # cache entry shared by the other instances
+        return OrderedDict(codes)
+
+    @staticmethod
+    def _window_cache_backend():
+        """Return the window cache backend selected by MOABB_CACHE_BACKEND.
+
+        The default HDF5 backend serializes concurrent readers on the GIL; the
+        zarr backend compresses each chunk with Blosc/LZ4 so parallel workers
+        can read the cache independently.
+        """
+        backend = os.environ.get("MOABB_CACHE_BACKEND", "hdf5")
+        if backend not in ("hdf5", "zarr"):
+            raise ValueError("Invalid cache backend: {:s}".format(backend))
+        if backend == "zarr" and not _zarr_available:
+            raise ImportError(
+                "The zarr cache backend requires zarr 2.x and numcodecs. "
+                "`pip install moabb[acceleration]` or `pip install 'zarr<3' "
+                "numcodecs`, or unset MOABB_CACHE_BACKEND."
+            )
+        return backend
+
+    def _window_cache_fname(self, subject):
+        """Return the path of the cached per-frame labels of a single subject."""
+        cache_dir = osp.join(osp.expanduser("~"), ".moabb_cache", "castillos2023")
+        os.makedirs(cache_dir, exist_ok=True)
+        ext = "h5" if self._window_cache_backend() == "hdf5" else "zarr"
+        return osp.join(
+            cache_dir,
+            "S{:d}_{:s}_{:s}_{:s}.{:s}".format(
+                subject, self.paradigm_type, str(self.window_size), str(self.sfreq), ext
+            ),
+        )
+
+    @staticmethod
+    def _read_full_chunks(ds):
+        """Read a chunked dataset into RAM with chunk-aligned sequential reads.
+
+        Reading whole chunks in storage order is the fastest access pattern for
+        both HDF5 and zarr; never index the on-disk dataset with a list of
+        frame indices, shuffle in RAM afterwards instead.
+        """
+        out = np.empty(ds.shape, ds.dtype)
+        step = ds.chunks[0] if ds.chunks else ds.shape[0]
+        for i0 in range(0, ds.shape[0], step):
+            out[i0 : i0 + step] = ds[i0 : i0 + step]
+        return out
+
+    def _load_window_cache(self, fname, source_mtime):
+        """Load the cached per-frame labels, skipping stale caches.
+
+        Only the labels are cached: the window epochs themselves are never used
+        after the stim channels are built, so persisting them would only burn
+        disk space and read bandwidth. Returns None on a cache miss or when the
+        source file changed since the cache was written.
+        """
+        if not osp.exists(fname):
+            return None
+        if self._window_cache_backend() == "zarr":
+            root = zarr.open(fname, mode="r")
+            if root.attrs.get("source_mtime") != source_mtime:
+                return None
+            return self._read_full_chunks(root["y"])
+        with h5py.File(fname, "r") as f:
+            if f.attrs.get("source_mtime") != source_mtime:
+                return None
+            y = self._read_full_chunks(f["y"])
+        return y
+
+    def _save_window_cache(self, fname, y, source_mtime):
+        """Write the per-frame labels to a chunked cache."""
+        chunks = (min(4096, y.shape[0]),) + y.shape[1:]
+        if self._window_cache_backend() == "zarr":
+            root = zarr.open(fname, mode="w")
+            root.create_dataset(
+                "y",
+                data=y,
+                chunks=chunks,
+                compressor=numcodecs.Blosc(
+                    cname="lz4", clevel=1, shuffle=numcodecs.Blosc.SHUFFLE
+                ),
+            )
+            root.attrs["source_mtime"] = source_mtime
+            return
+        with h5py.File(fname, "w") as f:
+            f.create_dataset("y", data=y, chunks=chunks, compression=None)
+            f.attrs["source_mtime"] = source_mtime
 
     def data_path(
         self,
@@ -221,24 +413,13 @@ class BaseCastillos2023(BaseDataset):
         if subject not in self.subject_list:
             raise (ValueError("Invalid subject number"))
 
-        subject_paths = []
-
         url = "https://zenodo.org/records/8255618/files/4Class-CVEP.zip"
-        path_zip = dl.data_dl(url, "4Class-VEP", path, force_update, verbose)
-        path_folder = "C" + path_zip.strip("4Class-VEP.zip")
-        print(path_folder)
-
-        # check if has to unzip
-        if not (osp.isdir(path_folder + "4Class-VEP")):
-            zip_ref = z.ZipFile(path_zip, "r")
-            zip_ref.extractall(path_folder)
+        path_folder = _resolve_root(url, path, force_update, verbose)
 
-        subject_paths.append(
+        return [
             path_folder
             + "4Class-CVEP/P{:d}/P{:d}_{:s}.set".format(subject, subject, paradigm_type)
-        )
-
-        return subject_paths
+        ]
 
     def _to_window_by_frame(
         self, data, labels, n_samples_windows, codes, offset=0, focus_rising=None
@@ -272,36 +453,50 @@ class BaseCastillos2023(BaseDataset):
             The array of the array taken
         """
         length = int((2.2 - self.window_size) * self.fps)
-        X = np.empty(shape=((length) * data.shape[0], self.n_channels, n_samples_windows))
-        Y = np.empty(shape=((length) * data.shape[0]), dtype=int)
-        idx_taken = []
-        for trial_nb, trial in enumerate(data):
-            lab = labels[trial_nb]
-            c = codes[lab]
-            labels_upsampled = np.repeat(c, self.fps // self.fps)
-            labels_upsampled = np.concatenate(
-                (np.zeros(int(offset * self.fps), dtype=int), np.array(labels_upsampled))
+        data = np.asarray(data)
+        # One strided view over every frame-aligned window of every trial, of shape
+        # (n_trials, n_channels, length, n_samples_windows), then a single batched
+        # copy instead of one memcpy per frame.
+        if _numba_available:
+            # JIT-compiled copy parallelized over trials with prange
+            X = _copy_windows_numba(np.ascontiguousarray(data), length, n_samples_windows)
+        else:
+            windows = sliding_window_view(data, n_samples_windows, axis=2)[
+                :, :, :length, :
+            ]
+            # Materialize straight to float32: writing the copy in single precision
+            # halves the bytes moved compared to filling float64 and casting after.
+            X = (
+                np.moveaxis(windows, 2, 1)
+                .astype(np.float32)
+                .reshape(data.shape[0] * length, self.n_channels, n_samples_windows)
             )
+        Y = np.empty(shape=((length) * data.shape[0]), dtype=int)
+        idx_taken = np.arange(data.shape[0] * length, dtype=np.int64)
+        # Pack the codebook into one dense int8 array so the per-trial lookup is a
+        # row index, and build the offset padding once for all trials
+        max_len = max(len(c) for c in codes.values())
+        codes_arr = np.zeros((len(codes), max_len), dtype=np.int8)
+        for k, c in codes.items():
+            codes_arr[k, : len(c)] = c
+        pad = np.zeros(int(offset * self.fps), dtype=np.int8)
+        for trial_nb in range(data.shape[0]):
+            labels_upsampled = np.concatenate((pad, codes_arr[labels[trial_nb]]))
             if focus_rising is not None:
-                hi_indices = []
-                for idx in range(1, len(labels_upsampled)):
-                    if (
-                        (focus_rising is not None)
-                        and (labels_upsampled[idx - 1] == 0)
-                        and (labels_upsampled[idx] == 1)
-                    ):
-                        hi_indices.append(idx)
+                # Rising edges are the frames where the code goes from 0 to 1
+                hi_indices = (
+                    np.flatnonzero(
+                        (labels_upsampled[:-1] == 0) & (labels_upsampled[1:] == 1)
+                    )
+                    + 1
+                )
                 focused_labels = np.zeros(length)
-                for idx in hi_indices:
-                    focused_labels[idx : idx + 4] = 1
+                frames = hi_indices[:, None] + np.arange(4)[None, :]
+                focused_labels[frames[frames < length]] = 1
             else:
                 focused_labels = labels_upsampled.copy()
 
-            for idx in range(length):
-                X[trial_nb * length + idx] = trial[:, idx : idx + n_samples_windows]
-                Y[trial_nb * length + idx] = focused_labels[idx]
-                idx_taken.append(trial_nb * length + idx)
-        X = X.astype(np.float32)
+            Y[trial_nb * length : (trial_nb + 1) * length] = focused_labels[:length]
         return X, Y, idx_taken
 
     def _onset_annotations(
@@ -331,44 +526,25 @@ class BaseCastillos2023(BaseDataset):
             the onset in second of the frame where the flash is off
         """
         assert self.sfreq != 0
-        new_onset_1 = []
-        new_onset_0 = []
-        current_code = 0
+        onset_window = np.asarray(onset_window)
+        label_window = np.asarray(label_window)
         onset_code = np.ceil(onset_code * self.fps / self.sfreq)
         nb_seq_min -= 1
-        onset_shift = onset_code[current_code + nb_seq_min]
         time_trial = TRIAL_PRESENTATION_TIME - self.window_size
-        for i, o in enumerate(onset_window):
-            if label_window[i] == 1:
-                if current_code == nb_seq_max - 1 - nb_seq_min:
-                    new_onset_1.append(o + onset_shift)
-                else:
-                    if (
-                        o + onset_shift
-                        >= onset_code[current_code + nb_seq_min] + time_trial * self.fps
-                    ):
-                        current_code += 1
-                        onset_shift = (
-                            onset_code[current_code + nb_seq_min]
-                            - time_trial * self.fps * current_code
-                        )
-                    new_onset_1.append(o + onset_shift)
-            else:
-                if current_code == nb_seq_max - 1 - nb_seq_min:
-                    new_onset_0.append(o + onset_shift)
-                else:
-                    if (
-                        o + onset_shift
-                        >= onset_code[current_code + nb_seq_min] + time_trial * self.fps
-                    ):
-                        current_code += 1
-                        onset_shift = (
-                            onset_code[current_code + nb_seq_min]
-                            - time_trial * self.fps * current_code
-                        )
-                    new_onset_0.append(o + onset_shift)
-        new_onset_0 = np.array(list(filter(lambda i: i not in new_onset_1, new_onset_0)))
-        return np.array(new_onset_1) / self.fps, np.array(new_onset_0) / self.fps
+        # Each code covers int(time_trial * fps) consecutive frames (the same count
+        # the window builder emits per trial), so the code a frame belongs to is a
+        # floor division away instead of a sequential scan
+        frames_per_code = int(time_trial * self.fps)
+        current_code = np.minimum(
+            onset_window // frames_per_code, nb_seq_max - 1 - nb_seq_min
+        )
+        onset_shift = (
+            onset_code[current_code + nb_seq_min] - time_trial * self.fps * current_code
+        )
+        new_onset = onset_window + onset_shift
+        new_onset_1 = new_onset[label_window == 1]
+        new_onset_0 = np.setdiff1d(new_onset[label_window != 1], new_onset_1)
+        return new_onset_1 / self.fps, new_onset_0 / self.fps
 
 
 class CasitllosBurstVEP100(BaseCastillos2023):
@@ -423,13 +599,15 @@ class CasitllosBurstVEP100(BaseCastillos2023):
 
     """
 
-    def __init__(self):
+    def __init__(self, target_sfreq=None, cache_windows=False):
         super().__init__(
             events={"0": 100, "1": 101},
             sessions_per_subject=1,
             code="CasitllosBurstVEP100",
             paradigm="cvep",
             paradigm_type="burst100",
+            target_sfreq=target_sfreq,
+            cache_windows=cache_windows,
         )
 
 
@@ -485,13 +663,15 @@ class CasitllosBurstVEP40(BaseCastillos2023):
 
     """
 
-    def __init__(self):
+    def __init__(self, target_sfreq=None, cache_windows=False):
         super().__init__(
             events={"0": 100, "1": 101},
             sessions_per_subject=1,
             code="CasitllosBurstVEP40",
             paradigm="cvep",
             paradigm_type="burst40",
+            target_sfreq=target_sfreq,
+            cache_windows=cache_windows,
         )
 
 
@@ -547,13 +727,15 @@ class CasitllosCVEP100(BaseCastillos2023):
 
     """
 
-    def __init__(self):
+    def __init__(self, target_sfreq=None, cache_windows=False):
         super().__init__(
             events={"0": 100, "1": 101},
             sessions_per_subject=1,
             code="CasitllosBurstVEP100",
             paradigm="cvep",
             paradigm_type="mseq100",
+            target_sfreq=target_sfreq,
+            cache_windows=cache_windows,
         )
 
 
@@ -609,11 +791,13 @@ class CasitllosCVEP40(BaseCastillos2023):
 
     """
 
-    def __init__(self):
+    def __init__(self, target_sfreq=None, cache_windows=False):
         super().__init__(
             events={"0": 100, "1": 101},
             sessions_per_subject=1,
             code="CasitllosBurstVEP40",
             paradigm="cvep",
             paradigm_type="mseq40",
+            target_sfreq=target_sfreq,
+            cache_windows=cache_windows,
         )
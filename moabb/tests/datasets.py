@@ -1,17 +1,20 @@
 import inspect
 import logging
+import os
 import shutil
 import tempfile
 import unittest
 
+import h5py
 import mne
 import numpy as np
 import pytest
 
 import moabb.datasets as db
 import moabb.datasets.compound_dataset as db_compound
-from moabb.datasets import Cattan2019_VR, Shin2017A, Shin2017B
+from moabb.datasets import Cattan2019_VR, Shin2017A, Shin2017B, castillos2023
 from moabb.datasets.base import BaseDataset, is_abbrev, is_camel_kebab_case
+from moabb.datasets.castillos2023 import CasitllosBurstVEP100
 from moabb.datasets.compound_dataset import CompoundDataset
 from moabb.datasets.compound_dataset.utils import compound_dataset_list
 from moabb.datasets.fake import FakeDataset, FakeVirtualRealityDataset
@@ -487,3 +490,120 @@ class Test_CompoundDataset(unittest.TestCase):
         ]
         assert len(compound_dataset_list) == len(all_datasets)
         assert set(compound_dataset_list) == set(all_datasets)
+
+
+class Test_Castillos2023(unittest.TestCase):
+    def setUp(self):
+        self.dataset = CasitllosBurstVEP100()
+
+    def test_onset_annotations_code_boundaries(self):
+        d = self.dataset
+        frames_per_code = int((2.2 - d.window_size) * d.fps)
+        n_trials = 3
+        onset_window = np.arange(n_trials * frames_per_code)
+        label_window = np.ones(n_trials * frames_per_code, dtype=int)
+        onset_code = np.array([0, 2000, 4000])
+
+        onset_1, onset_0 = d._onset_annotations(
+            onset_window, label_window, onset_code, 1, n_trials
+        )
+
+        self.assertEqual(onset_1.size, onset_window.size)
+        self.assertEqual(onset_0.size, 0)
+        onset_code_frames = np.ceil(onset_code * d.fps / d.sfreq)
+        first_frames = np.arange(n_trials) * frames_per_code
+        # The first frame of trial k starts exactly at the onset of code k...
+        np.testing.assert_allclose(onset_1[first_frames], onset_code_frames / d.fps)
+        # ...and the last frame of trial k still belongs to code k
+        last_frames = first_frames + frames_per_code - 1
+        np.testing.assert_allclose(
+            onset_1[last_frames], (onset_code_frames + frames_per_code - 1) / d.fps
+        )
+
+    def test_onset_annotations_split(self):
+        d = self.dataset
+        frames_per_code = int((2.2 - d.window_size) * d.fps)
+        n_trials = 2
+        onset_window = np.arange(n_trials * frames_per_code)
+        label_window = np.zeros(n_trials * frames_per_code, dtype=int)
+        label_window[::2] = 1
+        onset_code = np.array([0, 2000])
+
+        onset_1, onset_0 = d._onset_annotations(
+            onset_window, label_window, onset_code, 1, n_trials
+        )
+
+        # Every frame lands in exactly one of the two outputs
+        self.assertEqual(onset_1.size, np.sum(label_window == 1))
+        self.assertEqual(onset_0.size, np.sum(label_window == 0))
+        self.assertEqual(np.intersect1d(onset_1, onset_0).size, 0)
+
+    def _cache_roundtrip(self, ext):
+        d = self.dataset
+        rng = np.random.RandomState(42)
+        y = rng.randint(0, 2, 8)
+        tempdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tempdir, "windows." + ext)
+            # missing cache
+            self.assertIsNone(d._load_window_cache(fname, 1.0))
+            d._save_window_cache(fname, y, 1.0)
+            np.testing.assert_array_equal(y, d._load_window_cache(fname, 1.0))
+            # stale cache: the source file changed since it was written
+            self.assertIsNone(d._load_window_cache(fname, 2.0))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_window_cache_opt_in(self):
+        # The cache never touches the disk unless explicitly requested
+        self.assertFalse(self.dataset.cache_windows)
+        self.assertTrue(CasitllosBurstVEP100(cache_windows=True).cache_windows)
+
+    def test_window_cache_hdf5(self):
+        self._cache_roundtrip("h5")
+
+    def test_window_cache_zarr(self):
+        if not castillos2023._zarr_available:
+            self.skipTest("zarr is not installed")
+        os.environ["MOABB_CACHE_BACKEND"] = "zarr"
+        try:
+            self._cache_roundtrip("zarr")
+        finally:
+            del os.environ["MOABB_CACHE_BACKEND"]
+
+    def test_window_cache_invalid_backend(self):
+        os.environ["MOABB_CACHE_BACKEND"] = "parquet"
+        try:
+            self.assertRaises(ValueError, self.dataset._window_cache_backend)
+        finally:
+            del os.environ["MOABB_CACHE_BACKEND"]
+
+    def test_read_full_chunks(self):
+        rng = np.random.RandomState(42)
+        X = rng.randn(8, 4, 5)
+        tempdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tempdir, "chunked.h5")
+            with h5py.File(fname, "w") as f:
+                # chunk length that does not divide the first axis
+                f.create_dataset("X", data=X, chunks=(3, 4, 5))
+            with h5py.File(fname, "r") as f:
+                np.testing.assert_array_equal(self.dataset._read_full_chunks(f["X"]), X)
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_code2array_cache_isolation(self):
+        d = self.dataset
+        event_id = {"101_0": 1, "110_1": 2}
+        codes = d._code2array(event_id)
+        codes[0] = None
+        codes2 = d._code2array(dict(event_id))
+        np.testing.assert_array_equal(codes2[0], [1, 0, 1])
+
+    def test_load_all(self):
+        d = self.dataset
+        d.data_path = lambda subject, paradigm_type: []
+        d._get_single_subject_data = lambda subject: {"0": {"0": subject}}
+        data = d.load_all(n_jobs=1)
+        self.assertEqual(set(data.keys()), set(d.subject_list))
+        self.assertEqual(data[5], {"0": {"0": 5}})